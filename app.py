@@ -16,8 +16,10 @@ Run:
 """
 
 import ast
+import functools
 import math
 import operator as op
+import re
 import streamlit as st
 
 # ---------- SAFE EVALUATOR ----------
@@ -54,7 +56,7 @@ _math_funcs = {
     "abs": abs,
     "floor": math.floor,
     "ceil": math.ceil,
-    "factorial": math.factorial,
+    "factorial": functools.lru_cache(maxsize=1024)(math.factorial),  # big-int work; inputs repeat across reruns
     "radians": math.radians,
     "degrees": math.degrees,
 }
@@ -65,88 +67,178 @@ _constants = {
     "e": math.e,
 }
 
+# Characters that can appear in a calculator expression; anything else is rejected before ast.parse
+_allowed_chars_re = re.compile(r"[\d\s+\-*/%().,a-zA-Z_]*", re.ASCII)
+
+# A bare int/float literal (the "user just typed a number" case); leading zeros are left to the parser
+_number_re = re.compile(r"[+-]?(?:(?P<int>0|[1-9]\d*)|\d+\.\d*|\.\d+)", re.ASCII)
+
+# Format spec for float results: 12 significant digits
+_result_format = ".12g"
+
 class EvalError(Exception):
     pass
 
-def _eval_node(node):
-    """Recursively evaluate an AST node in a safe manner."""
-    if isinstance(node, ast.Expression):
-        return _eval_node(node.body)
+# Preallocated error for the character prefilter, the only rejection that runs ahead of the caches
+# (on every rerun while the input is invalid). Raised as ``err.with_traceback(None)`` so tracebacks
+# don't accumulate on the shared instance; the rejections behind the caches raise fresh errors.
+_err_illegal_char = EvalError("Illegal character in expression.")
 
-    # Numbers (int, float)
-    if isinstance(node, ast.Constant):
-        if isinstance(node.value, (int, float)):
-            return node.value
-        else:
-            raise EvalError("Only numeric constants are allowed.")
+# Handlers receive the node, the implementation its resolver looked up and the already-evaluated
+# values of its children (see _eval_node).
+def _eval_value(node, value):
+    return value
 
-    # Python 3.7 and older used Num; some AST versions may present nums differently
-    if isinstance(node, ast.Num):
-        return node.n
+def _eval_error(node, message):
+    raise EvalError(message)
 
+def _eval_binop(node, func, left, right):
     # Binary operations: + - * / ** // %
-    if isinstance(node, ast.BinOp):
-        left = _eval_node(node.left)
-        right = _eval_node(node.right)
-        op_type = type(node.op)
-        if op_type in _allowed_binops:
-            func = _allowed_binops[op_type]
-            try:
-                return func(left, right)
-            except Exception as e:
-                raise EvalError(f"Error in operation: {e}")
-        else:
-            raise EvalError(f"Operator {op_type} not supported.")
+    try:
+        return func(left, right)
+    except Exception as e:
+        raise EvalError(f"Error in operation: {e}")
 
+def _eval_unaryop(node, func, operand):
     # Unary ops: +, -
-    if isinstance(node, ast.UnaryOp):
-        operand = _eval_node(node.operand)
-        op_type = type(node.op)
-        if op_type in _allowed_unaryops:
-            return _allowed_unaryops[op_type](operand)
-        else:
-            raise EvalError(f"Unary operator {op_type} not supported.")
+    return func(operand)
 
+def _eval_call(node, func, *args):
     # Function calls from whitelist: sin(x), log(x, base)
-    if isinstance(node, ast.Call):
-        if isinstance(node.func, ast.Name):
-            func_name = node.func.id
-            if func_name in _math_funcs:
-                func = _math_funcs[func_name]
-                args = [_eval_node(arg) for arg in node.args]
-                try:
-                    return func(*args)
-                except TypeError as e:
-                    raise EvalError(f"Bad arguments for {func_name}: {e}")
-                except Exception as e:
-                    raise EvalError(f"Error calling {func_name}: {e}")
-            else:
-                raise EvalError(f"Function '{func_name}' is not allowed.")
-        else:
-            raise EvalError("Only direct function names are allowed.")
+    func_name = node.func.id
+    try:
+        return func(*args)
+    except TypeError as e:
+        raise EvalError(f"Bad arguments for {func_name}: {e}")
+    except Exception as e:
+        raise EvalError(f"Error calling {func_name}: {e}")
+
+# Resolvers check a single node and look up what it needs, returning (handler, impl, children).
+# A node that fails its check gets no children and the _eval_error handler instead.
+def _resolve_disallowed(node):
+    return _eval_error, "Disallowed Python construct in expression.", ()
+
+def _resolve_constant(node):
+    # Numbers (int, float)
+    if isinstance(node.value, (int, float)):
+        return _eval_value, node.value, ()
+    return _eval_error, "Only numeric constants are allowed.", ()
 
+def _resolve_name(node):
     # Names (variables/constants)
-    if isinstance(node, ast.Name):
-        if node.id in _constants:
-            return _constants[node.id]
+    if node.id in _constants:
+        return _eval_value, _constants[node.id], ()
+    return _eval_error, f"Unknown identifier: {node.id}", ()
+
+def _resolve_binop(node):
+    func = _allowed_binops.get(type(node.op))
+    if func is None:
+        return _resolve_disallowed(node)
+    return _eval_binop, func, (node.left, node.right)
+
+def _resolve_unaryop(node):
+    func = _allowed_unaryops.get(type(node.op))
+    if func is None:
+        return _resolve_disallowed(node)
+    return _eval_unaryop, func, (node.operand,)
+
+def _resolve_call(node):
+    # The callee is checked before the arguments, so e.g. foo(1/0) reports the unknown function
+    if not isinstance(node.func, ast.Name):
+        return _eval_error, "Only direct function names are allowed.", ()
+    func = _math_funcs.get(node.func.id)
+    if func is None:
+        return _eval_error, f"Function '{node.func.id}' is not allowed.", ()
+    if node.keywords:
+        return _resolve_disallowed(node)
+    return _eval_call, func, node.args
+
+# Node type -> resolver. Default-deny: any other node type is rejected.
+# Parentheses are handled by the structure of AST (no explicit node).
+_node_resolvers = {
+    ast.Constant: _resolve_constant,
+    ast.Name: _resolve_name,
+    ast.BinOp: _resolve_binop,
+    ast.UnaryOp: _resolve_unaryop,
+    ast.Call: _resolve_call,
+}
+
+def _eval_node(node):
+    """Validate and evaluate an AST node in a single iterative pass with an explicit value stack.
+
+    Whitelist checks, name resolution and operator/function lookup happen as each node is
+    linearized. Errors are raised at the node's left-to-right position, so the first one wins.
+    """
+    # Linearize the tree: popping a node and pushing its children yields reversed post-order
+    order = []
+    work = [node]
+    while work:
+        current = work.pop()
+        resolve = _node_resolvers.get(type(current), _resolve_disallowed)
+        handler, impl, children = resolve(current)
+        order.append((handler, current, impl, len(children)))
+        work.extend(children)
+
+    # Run it like a small stack machine: each node pops its operands and pushes its result
+    values = []
+    for handler, current, impl, arity in reversed(order):
+        if arity:
+            operands = values[-arity:]
+            del values[-arity:]
+            values.append(handler(current, impl, *operands))
         else:
-            raise EvalError(f"Unknown identifier: {node.id}")
+            values.append(handler(current, impl))
+    return values[0]
 
-    # Parentheses are handled by the structure of AST (no explicit node)
-    raise EvalError(f"Unsupported expression: {ast.dump(node)}")
+@functools.lru_cache(maxsize=256)
+def _parse_and_validate(expr: str):
+    """Parse, validate and constant-fold an expression once, returning the folded AST.
 
-def safe_eval(expr: str):
-    """Safely evaluate a math expression using AST parsing."""
+    Expressions have no variables, so a valid tree always folds to a single ``ast.Constant``.
+    """
     try:
         parsed = ast.parse(expr, mode="eval")
     except SyntaxError as e:
         raise EvalError(f"Syntax error: {e}")
+    except (RecursionError, MemoryError):
+        # The parser recurses per nesting level and reports its own stack overflow as MemoryError
+        raise EvalError("Expression is too deeply nested.") from None
+    # Unwrap the top-level ast.Expression here so _eval_node never sees it
+    return ast.copy_location(ast.Constant(value=_eval_node(parsed.body)), parsed.body)
 
-    # Walk AST to ensure there are no disallowed nodes quickly
-    for node in ast.walk(parsed):
-        if isinstance(node, (ast.Import, ast.ImportFrom, ast.Lambda, ast.Global, ast.Nonlocal, ast.ClassDef, ast.FunctionDef)):
-            raise EvalError("Disallowed Python construct in expression.")
-    return _eval_node(parsed)
+def _evaluate(expr: str):
+    """Evaluate a math expression from its cached, folded AST (uncached result)."""
+    # The stack machine in _eval_node already ran while folding; only the constant is left
+    return _parse_and_validate(expr).value
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _cached_eval(expr: str):
+    """Evaluate ``expr`` once per distinct string.
+
+    Streamlit reruns the whole script on every widget interaction, so the same
+    expression is evaluated over and over. Failures are cached as
+    ``(False, message)`` so they are re-raised instead of being returned as values.
+    """
+    try:
+        return True, _evaluate(expr)
+    except EvalError as e:
+        return False, str(e)
+
+def safe_eval(expr: str):
+    """Safely evaluate a math expression using AST parsing (memoized per expression)."""
+    if not _allowed_chars_re.fullmatch(expr):
+        raise _err_illegal_char.with_traceback(None)
+    number = _number_re.fullmatch(expr.strip())
+    if number:
+        try:
+            return int(number.group()) if number.group("int") else float(number.group())
+        except ValueError:
+            # int() refuses literals past sys.get_int_max_str_digits(); the parser reports those
+            pass
+    ok, value = _cached_eval(expr)
+    if not ok:
+        raise EvalError(value)
+    return value
 
 # ---------- STREAMLIT UI ----------
 st.set_page_config(page_title="Calculator (Streamlit)", layout="centered")
@@ -167,10 +259,23 @@ Constants available: `pi`, `e`
 if "history" not in st.session_state:
     st.session_state.history = []
 
+# Keypad buttons append to the expression in Streamlit's callback phase, before the script reruns,
+# so the text input (bound to the same session_state key) already shows the updated expression.
+def _append(label):
+    st.session_state.expr_buffer = st.session_state.get("expr_buffer", "") + label
+
+# Clearing also runs as a callback: the state is reset before the widgets are rebuilt,
+# so the natural rerun shows it without an extra st.experimental_rerun()
+def _clear():
+    st.session_state.expr_buffer = ""
+
+def _clear_history():
+    st.session_state.history = []
+
 # Input area
 col1, col2 = st.columns([3, 1])
 with col1:
-    expr = st.text_input("Expression", value="", placeholder="e.g. 2+2 or sqrt(2)*pi")
+    expr = st.text_input("Expression", key="expr_buffer", placeholder="e.g. 2+2 or sqrt(2)*pi")
 with col2:
     if st.button("Calculate"):
         # will be handled below after validation
@@ -185,32 +290,14 @@ buttons = [
     ("1", kp_cols[0]), ("2", kp_cols[1]), ("3", kp_cols[2]), ("-", kp_cols[3]),
     ("0", kp_cols[0]), (".", kp_cols[1]), ("(", kp_cols[2]), (")", kp_cols[3]),
 ]
-# Display buttons and allow appending to expression
 for label, column in buttons:
-    if column.button(label):
-        # append to expression (update via session_state hack)
-        # Use a key in session_state to remember unsaved expr between reruns
-        if "expr_buffer" not in st.session_state:
-            st.session_state.expr_buffer = expr
-        st.session_state.expr_buffer = (st.session_state.get("expr_buffer", "") or "") + label
-        # Rerun: set expr local var to buffer so user sees it
-        expr = st.session_state.expr_buffer
+    column.button(label, on_click=_append, args=(label,))
 
 # Scientific function buttons
 func_cols = st.columns(4)
 func_buttons = ["sin(", "cos(", "tan(", "sqrt("]
 for label, col in zip(func_buttons, func_cols):
-    if col.button(label):
-        if "expr_buffer" not in st.session_state:
-            st.session_state.expr_buffer = expr
-        st.session_state.expr_buffer = (st.session_state.get("expr_buffer", "") or "") + label
-        expr = st.session_state.expr_buffer
-
-# If session buffer exists, show it in the input box by re-rendering
-if "expr_buffer" in st.session_state and st.session_state.expr_buffer != expr:
-    # Show the buffered expression (streamlit input does not accept dynamic set easily),
-    # we reassign expr variable so that next calculation uses it.
-    expr = st.session_state.expr_buffer
+    col.button(label, on_click=_append, args=(label,))
 
 # Perform calculation if user clicked button or pressed Enter in text_input
 # Streamlit can't directly detect Enter reliably, so use a separate button as main trigger
@@ -222,15 +309,17 @@ if st.button("Compute"):
             result = safe_eval(expr)
             # Format result (float vs int)
             if isinstance(result, float):
-                # show a concise float (avoid long repr)
-                result_display = float(f"{result:.12g}")
+                if result.is_integer() and abs(result) < 1e16:
+                    # integer-valued float (e.g. sqrt(16)): show it as an int, no string round-trip
+                    result_display = int(result)
+                else:
+                    # show a concise float (avoid long repr); keep the formatted string, no float() reparse
+                    result_display = format(result, _result_format)
             else:
                 result_display = result
             st.success(f"Result: `{result_display}`")
             # Save to history
             st.session_state.history.insert(0, (expr, result_display))
-            # Clear expr buffer (but keep text_input content until user changes)
-            st.session_state.expr_buffer = ""
         except EvalError as e:
             st.error(f"Error: {e}")
         except Exception as e:
@@ -239,13 +328,10 @@ if st.button("Compute"):
 # Quick action buttons
 clear_col1, clear_col2 = st.columns([1, 3])
 with clear_col1:
-    if st.button("Clear"):
-        st.session_state.expr_buffer = ""
-        st.experimental_rerun()
+    st.button("Clear", on_click=_clear)
 
 with clear_col2:
-    if st.button("Clear History"):
-        st.session_state.history = []
+    st.button("Clear History", on_click=_clear_history)
 
 # History display
 st.markdown("### History")